@@ -35,12 +35,14 @@ Command‑line usage for batch classification::
 from __future__ import annotations
 
 import json
+import os
 import sys
 from functools import lru_cache
 from typing import Iterable, List, Optional
 
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
+
+import classifier as rule_classifier
 
 
 # Define the categories and their natural language descriptions.  These
@@ -55,37 +57,90 @@ CATEGORY_DESCRIPTIONS = {
 }
 
 
+# Precomputed category embeddings live next to this module; regenerate with
+# ``python build_category_embeddings.py`` whenever CATEGORY_DESCRIPTIONS change.
+CATEGORY_EMBEDDINGS_PATH = os.path.join(os.path.dirname(__file__), "category_embeddings.npy")
+
+
 @lru_cache(maxsize=1)
-def get_model() -> SentenceTransformer:
-    """Load and return the sentence‑transformer model.  Cached to avoid reloading."""
+def get_model() -> "SentenceTransformer":
+    """Load and return the embedding model.  Cached to avoid reloading.
+
+    Set ``USE_ONNX=1`` to use the INT8 ONNX Runtime backend from
+    ``onnx_encoder.py`` instead of the PyTorch model — typically 2‑4x faster
+    on CPU‑only deployments with the same output embeddings.
+
+    The imports live here rather than at module level so that callers which
+    only touch the precomputed category embeddings never pay the heavy
+    torch/transformers import cost.
+    """
+    if os.environ.get("USE_ONNX") == "1":
+        from onnx_encoder import OnnxEncoder
+
+        return OnnxEncoder()
+    import torch
+    from sentence_transformers import SentenceTransformer
+
     model = SentenceTransformer("all-MiniLM-L6-v2")
+    # Emails here are short (from + subject + capped snippet); 128 tokens is
+    # plenty and halves the padded sequence cost versus the 256 default.
+    model.max_seq_length = 128
+    if torch.cuda.is_available():
+        # fp16 halves weight bandwidth and roughly doubles matmul throughput
+        # on tensor cores; on CPU we stay fp32, where software fp16 is slow.
+        model = model.half().to("cuda")
     return model
 
 
-@lru_cache(maxsize=1)
-def get_category_embeddings():
-    """Compute embeddings for all category descriptions and cache them."""
+def compute_category_embeddings() -> np.ndarray:
+    """Encode the category descriptions from scratch with the full model."""
     model = get_model()
     descriptions = list(CATEGORY_DESCRIPTIONS.values())
-    embeddings = model.encode(descriptions, convert_to_tensor=True, normalize_embeddings=True)
+    embeddings = model.encode(descriptions, convert_to_numpy=True, normalize_embeddings=True)
+    return embeddings.astype(np.float32)
+
+
+@lru_cache(maxsize=1)
+def get_category_embeddings() -> np.ndarray:
+    """Return embeddings for all category descriptions.
+
+    The descriptions are fixed, so their embeddings are deterministic and are
+    shipped as a small ``.npy`` file computed at build time.  Loading that file
+    avoids re-encoding (and loading the model) on every cold start.  If the
+    file is missing the embeddings are computed and saved for next time.
+    """
+    if os.path.exists(CATEGORY_EMBEDDINGS_PATH):
+        return np.load(CATEGORY_EMBEDDINGS_PATH, mmap_mode="r")
+    embeddings = compute_category_embeddings()
+    np.save(CATEGORY_EMBEDDINGS_PATH, embeddings)
     return embeddings
 
 
 def _compose_email_text(from_addr: Optional[str], subject: Optional[str], snippet: Optional[str]) -> str:
-    """Concatenate relevant parts of the email into a single string for embedding."""
+    """Concatenate relevant parts of the email into a single string for embedding.
+
+    Each part is capped: the model truncates at ``max_seq_length`` tokens
+    anyway, so longer inputs only inflate tokenization work and padding.
+    """
     parts = []
     if from_addr:
-        parts.append(from_addr)
+        parts.append(from_addr[:120])
     if subject:
-        parts.append(subject)
+        parts.append(subject[:200])
     if snippet:
-        parts.append(snippet)
+        parts.append(snippet[:500])
     return ". ".join(parts)
 
 
 def classify_email(from_addr: Optional[str], subject: Optional[str], snippet: Optional[str]) -> str:
     """Classify a single email into a category based on its semantic similarity.
 
+    This is a convenience wrapper around :func:`classify_batch` so that single
+    and batched callers share one code path.  Hot paths that classify several
+    emails should call :func:`classify_batch` directly: encoding one email at a
+    time pays the full model dispatch overhead per message, whereas a batch
+    amortises it across a single forward pass.
+
     Parameters
     ----------
     from_addr : str
@@ -100,33 +155,53 @@ def classify_email(from_addr: Optional[str], subject: Optional[str], snippet: Op
     str
         The category with the highest cosine similarity score.
     """
-    model = get_model()
-    categories = list(CATEGORY_DESCRIPTIONS.keys())
-    cat_embeddings = get_category_embeddings()
-    email_text = _compose_email_text(from_addr, subject, snippet)
-    email_embedding = model.encode(email_text, convert_to_tensor=True, normalize_embeddings=True)
-    # Compute cosine similarity between email and each category
-    scores = util.cos_sim(email_embedding, cat_embeddings)[0]
-    # Find the index of the highest score
-    best_idx = int(np.argmax(scores.cpu().numpy()))
-    return categories[best_idx]
+    return classify_batch([{"from": from_addr, "subject": subject, "snippet": snippet}])[0]
 
 
-def classify_batch(messages: Iterable[dict]) -> List[str]:
+def classify_batch(messages: Iterable[dict], confidence_threshold: float = 0.35) -> List[str]:
     """Classify a batch of messages.  Each message should be a dict with keys
-    ``from``, ``subject`` and ``snippet``.  Returns a list of category strings.
+    ``from``, ``subject`` and ``snippet`` (``headers`` is optional).  Returns a
+    list of category strings.
+
+    The cheap rule-based classifier from ``classifier.py`` runs first; only
+    messages it leaves in its fallback category (``Primary``) are embedded, so
+    a typical inbox full of promos and notifications skips the transformer for
+    most messages.  When the best embedding similarity for a message falls
+    below ``confidence_threshold`` the rule-based fallback is kept.
     """
-    model = get_model()
+    messages = list(messages)
     categories = list(CATEGORY_DESCRIPTIONS.keys())
-    cat_embeddings = get_category_embeddings()
-    texts = []
-    for msg in messages:
-        texts.append(_compose_email_text(msg.get("from"), msg.get("subject"), msg.get("snippet")))
-    email_embeddings = model.encode(texts, convert_to_tensor=True, normalize_embeddings=True)
-    scores = util.cos_sim(email_embeddings, cat_embeddings)
-    # For each email, pick the category with the highest similarity
-    best_indices = np.argmax(scores.cpu().numpy(), axis=1)
-    return [categories[int(idx)] for idx in best_indices]
+    results: List[str] = []
+    uncertain_idx: List[int] = []
+    for i, msg in enumerate(messages):
+        rule_cat = rule_classifier.classify_email(
+            msg.get("from"), msg.get("subject"), msg.get("snippet"), msg.get("headers")
+        )
+        if rule_cat == "Primary":
+            uncertain_idx.append(i)
+        results.append(rule_cat)
+    if not uncertain_idx:
+        return results
+    model = get_model()
+    cat_embeddings = np.ascontiguousarray(get_category_embeddings(), dtype=np.float32)
+    texts = [
+        _compose_email_text(
+            messages[i].get("from"), messages[i].get("subject"), messages[i].get("snippet")
+        )
+        for i in uncertain_idx
+    ]
+    email_embeddings = model.encode(
+        texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True
+    )
+    # Both sides are L2-normalized, so cosine similarity reduces to a plain
+    # dot product; a single matmul in NumPy avoids the torch round-trip.
+    scores = email_embeddings @ cat_embeddings.T
+    best_indices = scores.argmax(axis=1)
+    for row, i in enumerate(uncertain_idx):
+        best = int(best_indices[row])
+        if scores[row, best] >= confidence_threshold:
+            results[i] = categories[best]
+    return results
 
 
 def main() -> None:
@@ -0,0 +1,30 @@
+"""
+build_category_embeddings.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Build‑time script that precomputes the embeddings for the fixed category
+descriptions in ``ai_classifier.py`` and saves them as a small ``.npy`` file
+next to the module.  Shipping the precomputed file lets runtime code load the
+category vectors with a plain ``np.load`` instead of loading the full
+sentence‑transformer model on every cold start.
+
+Run this whenever ``CATEGORY_DESCRIPTIONS`` (or the embedding model) changes::
+
+    python build_category_embeddings.py
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from ai_classifier import CATEGORY_EMBEDDINGS_PATH, compute_category_embeddings
+
+
+def main() -> None:
+    embeddings = compute_category_embeddings()
+    np.save(CATEGORY_EMBEDDINGS_PATH, embeddings)
+    print(f"Saved {embeddings.shape} category embeddings to {CATEGORY_EMBEDDINGS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
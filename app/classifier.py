@@ -16,6 +16,7 @@ the message snippet and optionally the list of headers.
 from __future__ import annotations
 
 import re
+from email.utils import parseaddr
 from typing import Dict, List, Optional
 
 
@@ -79,20 +80,51 @@ SOCIAL_KEYWORDS = {
 }
 
 
+def _compile_keyword_pattern(keywords: set[str]) -> "re.Pattern[str]":
+    """Compile a keyword set into one alternation pattern for single-pass scans.
+
+    Checking ``keyword in text`` per keyword walks the text once per keyword;
+    a compiled alternation lets the regex engine scan the text once in C for
+    all keywords of a set.  Longest keywords come first so overlapping entries
+    (e.g. ``confirm``/``confirmation``) cannot mask each other.
+    """
+    alternation = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(alternation)
+
+
+PROMOTION_PATTERN = _compile_keyword_pattern(PROMOTION_KEYWORDS)
+UPDATES_PATTERN = _compile_keyword_pattern(UPDATES_KEYWORDS)
+FORUM_PATTERN = _compile_keyword_pattern(FORUM_KEYWORDS)
+SOCIAL_PATTERN = _compile_keyword_pattern(SOCIAL_KEYWORDS)
+
+
 def extract_domain(email_address: str) -> str:
-    """Return the domain part of an email address in lower case."""
+    """Return the domain part of an email address in lower case.
+
+    Gmail ``From`` header values are usually of the form
+    ``"Alice Smith" <alice@example.com>``; ``parseaddr`` extracts the bare
+    address so the domain rules match on real headers, not just plain
+    addresses.
+
+    >>> extract_domain('"Alice" <a@b.com>')
+    'b.com'
+    """
     if not email_address:
         return ""
-    parts = email_address.split("@")
-    if len(parts) != 2:
+    _, addr = parseaddr(email_address)
+    _, sep, domain = addr.rpartition("@")
+    if not sep:
         return ""
-    return parts[1].lower().strip()
+    return domain.lower().strip()
 
 
-def has_any_keyword(text: str, keywords: set[str]) -> bool:
-    """Return True if any keyword appears in the given text (case‑insensitive)."""
-    text_lower = (text or "").lower()
-    return any(keyword in text_lower for keyword in keywords)
+def has_any_keyword(text_lower: str, pattern: "re.Pattern[str]") -> bool:
+    """Return True if any keyword of the compiled set appears in the text.
+
+    ``text_lower`` must already be lower‑cased; callers lower each field once
+    and reuse it across all keyword sets instead of re‑lowering per check.
+    """
+    return pattern.search(text_lower) is not None
 
 
 def classify_email(
@@ -120,26 +152,26 @@ def classify_email(
     str
         One of 'Social', 'Promotions', 'Updates', 'Forums', 'Work' or 'Primary'.
     """
-    # Normalize inputs
-    subject = subject or ""
-    snippet = snippet or ""
+    # Normalize inputs; lower-case each field once and reuse for every keyword set
+    sub_l = (subject or "").lower()
+    snip_l = (snippet or "").lower()
     domain = extract_domain(from_address or "")
 
     # 1. Social: check domain list and keywords
     if domain in SOCIAL_DOMAINS:
         return "Social"
-    if has_any_keyword(subject, SOCIAL_KEYWORDS) or has_any_keyword(snippet, SOCIAL_KEYWORDS):
+    if has_any_keyword(sub_l, SOCIAL_PATTERN) or has_any_keyword(snip_l, SOCIAL_PATTERN):
         return "Social"
 
     # 2. Promotions: check for marketing keywords or marketing domains
-    if has_any_keyword(subject, PROMOTION_KEYWORDS) or has_any_keyword(snippet, PROMOTION_KEYWORDS):
+    if has_any_keyword(sub_l, PROMOTION_PATTERN) or has_any_keyword(snip_l, PROMOTION_PATTERN):
         return "Promotions"
     # common marketing domains patterns
     if any(domain.endswith(suffix) for suffix in {"mailchimp.com", "sendgrid.net", "emarketing.com"}):
         return "Promotions"
 
     # 3. Updates: keywords typical of confirmations and receipts
-    if has_any_keyword(subject, UPDATES_KEYWORDS) or has_any_keyword(snippet, UPDATES_KEYWORDS):
+    if has_any_keyword(sub_l, UPDATES_PATTERN) or has_any_keyword(snip_l, UPDATES_PATTERN):
         return "Updates"
 
     # 4. Forums: presence of List‑Id header or forum keywords
@@ -147,7 +179,7 @@ def classify_email(
         list_id = headers.get("List-Id") or headers.get("List-id") or headers.get("List-ID")
         if list_id:
             return "Forums"
-    if has_any_keyword(subject, FORUM_KEYWORDS) or has_any_keyword(snippet, FORUM_KEYWORDS):
+    if has_any_keyword(sub_l, FORUM_PATTERN) or has_any_keyword(snip_l, FORUM_PATTERN):
         return "Forums"
 
     # 5. Work: heuristically label messages from non‑free domains as work
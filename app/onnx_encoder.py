@@ -0,0 +1,105 @@
+"""
+onnx_encoder.py
+~~~~~~~~~~~~~~~
+
+Optional ONNX Runtime backend for the ``all-MiniLM-L6-v2`` embedding model.
+
+The sentence‑transformers/PyTorch stack is convenient but heavyweight for a
+CPU‑only deployment.  This module exports the same MiniLM model to ONNX via
+``optimum``, applies INT8 dynamic weight quantization (4x smaller weights and
+VNNI int8 matmuls on modern x86), and wraps the result with the mean‑pooling
+and L2‑normalization steps that sentence‑transformers applies, so the output
+embeddings are drop‑in compatible with ``SentenceTransformer.encode``.
+
+It is activated by setting ``USE_ONNX=1`` in the environment; see
+``ai_classifier.get_model``.  The exported/quantized model is cached on disk
+so the export cost is paid once per machine.
+
+Requires the optional ``optimum[onnxruntime]`` dependency.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List, Union
+
+import numpy as np
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Where the exported + quantized model is cached between runs.
+ONNX_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "gmail_classifier",
+    "onnx-minilm-int8",
+)
+
+
+def _export_quantized_model(save_dir: str) -> None:
+    """Export MiniLM to ONNX and apply INT8 dynamic quantization into ``save_dir``."""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+    model.save_pretrained(save_dir)
+    quantizer = ORTQuantizer.from_pretrained(save_dir)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False)
+    quantizer.quantize(save_dir=save_dir, quantization_config=qconfig)
+
+
+class OnnxEncoder:
+    """Minimal ``SentenceTransformer``‑compatible encoder backed by ONNX Runtime.
+
+    Only the subset of the ``encode`` API that this project uses is
+    implemented: list‑of‑strings input, batching, NumPy output and optional
+    L2 normalization.
+    """
+
+    def __init__(self, cache_dir: str = ONNX_CACHE_DIR):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        if not os.path.isdir(cache_dir):
+            _export_quantized_model(cache_dir)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            cache_dir, file_name="model_quantized.onnx", session_options=options
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(cache_dir)
+        self.max_seq_length = 256
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        """Embed ``sentences`` and return a float32 array of shape (n, 384)."""
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        chunks = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            inputs = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            token_embs = self.model(**inputs).last_hidden_state
+            # Mean-pool over non-padding tokens, as sentence-transformers does.
+            mask = inputs["attention_mask"][..., None].astype(token_embs.dtype)
+            pooled = (token_embs * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            chunks.append(pooled)
+        embeddings = np.concatenate(chunks, axis=0).astype(np.float32)
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
@@ -1,11 +1,13 @@
 # streamlit_app.py
+from __future__ import annotations
+
 import os
 import json
 import base64
+import hashlib
 from typing import Optional, Dict, List, Tuple
 
 import streamlit as st
-import pandas as pd
 import numpy as np
 
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -13,8 +15,8 @@ from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+# Heavy imports (sentence_transformers/torch, pandas) are deferred to their
+# point of use so the auth steps of the wizard render without paying them.
 
 
 # =========================
@@ -34,6 +36,9 @@ OAUTH_CLIENT_SECRETS_PATH = os.environ.get("GOOGLE_CLIENT_SECRETS", "credentials
 TOKEN_BACKEND = os.environ.get("TOKEN_BACKEND", "fs")  # "fs" | "s3"
 TOKEN_DIR = os.environ.get("TOKEN_DIR", "tokens")      # fs root directory
 
+# The Gmail batch endpoint rejects batches with more than 100 inner requests.
+GMAIL_BATCH_LIMIT = 100
+
 # S3 config (only used if TOKEN_BACKEND == "s3")
 S3_BUCKET = os.environ.get("S3_BUCKET")
 S3_PREFIX = os.environ.get("S3_PREFIX", "tokens/")
@@ -50,6 +55,23 @@ class TokenStore:
         safe = email.lower().strip().replace("@", "_at_")
         return f"{safe}.json"
 
+# Token reads happen on every Streamlit rerun; cache them so widget
+# interactions don't re-hit the disk. The mtime in the key means a token
+# refresh (which rewrites the file) invalidates the cached contents.
+@st.cache_data(show_spinner=False)
+def _read_token_file(path: str, mtime: float) -> str:
+    with open(path) as f:
+        return f.read()
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _list_token_emails(root: str) -> List[str]:
+    emails: List[str] = []
+    if os.path.isdir(root):
+        for fn in os.listdir(root):
+            if fn.endswith(".json"):
+                emails.append(fn.replace("_at_", "@").replace(".json", ""))
+    return sorted(emails)
+
 class FileTokenStore(TokenStore):
     def __init__(self, root_dir: str):
         self.root = root_dir
@@ -59,14 +81,11 @@ class FileTokenStore(TokenStore):
             f.write(data)
     def load(self, key: str) -> Optional[str]:
         path = os.path.join(self.root, key)
-        return open(path).read() if os.path.exists(path) else None
+        if not os.path.exists(path):
+            return None
+        return _read_token_file(path, os.path.getmtime(path))
     def list_emails(self) -> List[str]:
-        emails: List[str] = []
-        if os.path.isdir(self.root):
-            for fn in os.listdir(self.root):
-                if fn.endswith(".json"):
-                    emails.append(fn.replace("_at_", "@").replace(".json", ""))
-        return sorted(emails)
+        return _list_token_emails(self.root)
 
 class S3TokenStore(TokenStore):
     def __init__(self, bucket: str, prefix: str = ""):
@@ -102,11 +121,22 @@ def get_store() -> TokenStore:
 # MODEL (cached)
 # =========================
 @st.cache_resource
-def get_model() -> SentenceTransformer:
-    return SentenceTransformer("all-MiniLM-L6-v2")
-
-def embed_texts(model: SentenceTransformer, texts: List[str]) -> np.ndarray:
-    return model.encode(texts)
+def get_model() -> "SentenceTransformer":
+    import torch
+    from sentence_transformers import SentenceTransformer
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return SentenceTransformer("all-MiniLM-L6-v2", device=device)
+
+def embed_texts(model: "SentenceTransformer", texts: List[str]) -> np.ndarray:
+    # Explicit batch size, NumPy output and no progress bar: the defaults
+    # return tensors and log a tqdm bar into the Streamlit server logs.
+    return model.encode(
+        texts,
+        batch_size=64,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
 
 
 # =========================
@@ -174,31 +204,34 @@ def pretty_label(raw_name: str) -> str:
         return mapping.get(raw_name, raw_name.replace("CATEGORY_", "").title())
     return raw_name
 
+# MiniLM truncates at 256 tokens, so anything beyond a couple of thousand
+# characters is decoded and copied for nothing.
+BODY_MAX_CHARS = 2048
+
 def parse_body(payload: dict) -> str:
     if not payload:
         return ""
     if "parts" not in payload or not payload["parts"]:
         data = payload.get("body", {}).get("data")
         if data:
-            return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
+            return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")[:BODY_MAX_CHARS]
+        return ""
+    # First pass: return the first text/plain part and skip decoding the
+    # (often much larger) HTML alternatives entirely. Only when no plain part
+    # exists do we fall back to decoding the first text/html part.
+    def first_part_of_type(mime_type: str) -> str:
+        stack = list(payload["parts"])
+        while stack:
+            p = stack.pop(0)
+            if "parts" in p and p["parts"]:
+                stack = list(p["parts"]) + stack
+                continue
+            data = p.get("body", {}).get("data")
+            if data and p.get("mimeType", "") == mime_type:
+                return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
         return ""
-    text_chunks, html_fallback = [], []
-    def walk(p):
-        if "parts" in p and p["parts"]:
-            for sub in p["parts"]:
-                walk(sub)
-            return
-        data = p.get("body", {}).get("data")
-        if not data: return
-        decoded = base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-        mt = p.get("mimeType", "")
-        if mt == "text/plain": text_chunks.append(decoded)
-        elif mt == "text/html": html_fallback.append(decoded)
-    for part in payload["parts"]:
-        walk(part)
-    if text_chunks: return "\n".join(text_chunks)
-    if html_fallback: return html_fallback[0]
-    return ""
+    body = first_part_of_type("text/plain") or first_part_of_type("text/html")
+    return body[:BODY_MAX_CHARS]
 
 def fetch_recent(svc, max_results: int, query: str) -> List[dict]:
     args = dict(userId="me", labelIds=["INBOX"], maxResults=max_results)
@@ -206,9 +239,34 @@ def fetch_recent(svc, max_results: int, query: str) -> List[dict]:
     res = svc.users().messages().list(**args).execute()
     items = res.get("messages", [])
     out: List[dict] = []
+    if not items:
+        return out
+    # Batched HTTP requests instead of N serial get() calls; the Gmail batch
+    # endpoint caps each batch at GMAIL_BATCH_LIMIT inner requests, and the
+    # UI allows max_results above that.
+    responses: Dict[str, dict] = {}
+
+    def _collect(request_id, response, exception):
+        if exception is not None:
+            raise exception
+        responses[request_id] = response
+
+    for start in range(0, len(items), GMAIL_BATCH_LIMIT):
+        batch = svc.new_batch_http_request(callback=_collect)
+        for it in items[start:start + GMAIL_BATCH_LIMIT]:
+            batch.add(
+                svc.users().messages().get(userId="me", id=it["id"]),
+                request_id=it["id"],
+            )
+        batch.execute()
     for it in items:
-        msg = svc.users().messages().get(userId="me", id=it["id"]).execute()
-        headers = {h["name"]: h["value"] for h in msg["payload"]["headers"]}
+        msg = responses[it["id"]]
+        # Only pull the two headers we use instead of materializing all of them.
+        headers = {
+            h["name"]: h["value"]
+            for h in msg["payload"]["headers"]
+            if h["name"] in ("Subject", "From")
+        }
         out.append({
             "id": it["id"],
             "subject": headers.get("Subject", "(no subject)"),
@@ -218,27 +276,81 @@ def fetch_recent(svc, max_results: int, query: str) -> List[dict]:
         })
     return out
 
-def apply_label(svc, message_id: str, label_id: str):
-    svc.users().messages().modify(
-        userId="me", id=message_id, body={"addLabelIds": [label_id]}
+def apply_label_batch(svc, message_ids: List[str], label_id: str):
+    svc.users().messages().batchModify(
+        userId="me", body={"ids": message_ids, "addLabelIds": [label_id]}
     ).execute()
 
 
 # =========================
 # CLASSIFICATION (labels as classes)
 # =========================
+@st.cache_resource
+def _prediction_cache() -> Dict[Tuple[bytes, bytes], str]:
+    """Content-hash keyed cache of predicted labels, shared across reruns.
+
+    Streamlit re-executes this script on every widget interaction, so without
+    a cache the same fetched emails get re-embedded on each rerun.  Keys pair
+    a text hash with a hash of the label set, so label edits invalidate stale
+    predictions automatically.
+    """
+    return {}
+
+
+def _content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "ignore"), digest_size=16).digest()
+
+
+# On-disk home for per-label-set embedding files; mmap-loading these shares
+# pages across Streamlit workers instead of re-allocating per process.
+LABEL_EMB_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "gmail_classifier",
+)
+
+
+@st.cache_resource(show_spinner=False)
+def get_label_embeddings(display_names: Tuple[str, ...]) -> np.ndarray:
+    """Embed the label names once per label set; reruns reuse the cached array.
+
+    The cache key is the tuple of names, so renaming, adding or removing a
+    label recomputes automatically.  Computed embeddings are persisted under
+    ``~/.cache/gmail_classifier`` and mmap-loaded on subsequent sessions, so
+    warm starts skip both the encode and the heap allocation.
+    """
+    path = os.path.join(
+        LABEL_EMB_CACHE_DIR, f"labels_{_content_hash(chr(0).join(display_names)).hex()}.npy"
+    )
+    if not os.path.exists(path):
+        embs = embed_texts(get_model(), list(display_names)).astype(np.float32)
+        os.makedirs(LABEL_EMB_CACHE_DIR, exist_ok=True)
+        np.save(path, embs)
+    return np.load(path, mmap_mode="r")
+
+
 def classify_to_existing_labels(
     texts: List[str],
     label_display_map: Dict[str, Tuple[str, str]]  # {display_name -> (label_id, raw_name)}
 ) -> List[str]:
     """Return predicted DISPLAY label for each text using embeddings against label display names."""
-    model = get_model()
     display_names = list(label_display_map.keys())
-    label_embs = embed_texts(model, display_names)
-    text_embs = embed_texts(model, texts)
-    sims = cosine_similarity(text_embs, label_embs)  # [n_texts x n_labels]
-    best_idx = sims.argmax(axis=1)
-    return [display_names[i] for i in best_idx]
+    cache = _prediction_cache()
+    labels_key = _content_hash("\x00".join(sorted(display_names)))
+    keys = [(_content_hash(t), labels_key) for t in texts]
+    preds: List[Optional[str]] = [cache.get(k) for k in keys]
+    miss_idx = [i for i, p in enumerate(preds) if p is None]
+    if miss_idx:
+        # embed_texts L2-normalizes, so cosine similarity is a single matmul;
+        # the contiguous float32 copy keeps the matmul on the BLAS fast path.
+        label_embs = np.ascontiguousarray(get_label_embeddings(tuple(display_names)))
+        text_embs = embed_texts(get_model(), [texts[i] for i in miss_idx])
+        sims = text_embs @ label_embs.T  # [n_misses x n_labels]
+        best_idx = sims.argmax(axis=1)
+        for row, i in enumerate(miss_idx):
+            pred = display_names[best_idx[row]]
+            preds[i] = pred
+            cache[keys[i]] = pred
+    return preds
 
 
 # =========================
@@ -333,20 +445,31 @@ def main():
 
     msgs = st.session_state.get("msgs", [])
     if msgs:
-        texts = [(m["subject"] + " " + m["snippet"] + " " + m["body"]).strip() for m in msgs]
+        # Cap the body contribution: the model truncates at 256 tokens, so
+        # longer text only adds tokenizer and padding work.
+        texts = [(m["subject"] + " " + m["snippet"] + " " + m["body"][:1000]).strip() for m in msgs]
         preds_display: List[str] = classify_to_existing_labels(texts, label_display_map)
 
         auto_apply = st.checkbox("Apply labels automatically", value=True)
-        rows = []
-        for m, pred_disp in zip(msgs, preds_display):
-            label_id, _raw = label_display_map[pred_disp]
-            applied = False
-            if auto_apply:
+        applied_flags = [False] * len(msgs)
+        if auto_apply:
+            # Group messages by predicted label and apply each group with one
+            # batchModify call: one HTTP request per label regardless of
+            # message count, and no concurrent use of the shared httplib2
+            # transport (which is not thread-safe).
+            by_label: Dict[str, List[int]] = {}
+            for i, pred_disp in enumerate(preds_display):
+                by_label.setdefault(label_display_map[pred_disp][0], []).append(i)
+            for label_id, idxs in by_label.items():
                 try:
-                    apply_label(svc, m["id"], label_id)
-                    applied = True
+                    apply_label_batch(svc, [msgs[i]["id"] for i in idxs], label_id)
                 except Exception as e:
                     st.error(f"Failed to apply label: {e}")
+                else:
+                    for i in idxs:
+                        applied_flags[i] = True
+        rows = []
+        for m, pred_disp, applied in zip(msgs, preds_display, applied_flags):
             rows.append({
                 "subject": m["subject"],
                 "from": m["from"],
@@ -354,6 +477,7 @@ def main():
                 "applied": applied
             })
 
+        import pandas as pd
         df = pd.DataFrame(rows)
         st.dataframe(df, use_container_width=True)
         if not df.empty: